@@ -21,13 +21,15 @@ def build_scanner() -> EpisodeScanner:
         auth=(config.username, config.password) if (config.username or config.password) else None,
         verify_ssl=config.verify_ssl,
         timeout=config.timeout,
+        max_concurrency=config.concurrency,
+        depth_infinity=config.depth_infinity,
     )
     state = StateStore(config.state_file)
-    storage = SQLiteStore(config.database_file)
+    storage = SQLiteStore(config.database_file, durability=config.database_durability)
     episode_filter = EpisodeFilter(config.video_exts, config.lang_rules)
 
     # 维持同旧脚本的日志格式
-    logging.getLogger().setLevel(getattr(logging, config.log_level.upper(), logging.INFO))
+    logging.getLogger().setLevel(config.log_level_int)
 
     return EpisodeScanner(
         config=config,
@@ -42,7 +44,12 @@ def main() -> None:
     """命令行执行入口。"""
 
     scanner = build_scanner()
-    scanner.run()
+    try:
+        scanner.run()
+    finally:
+        # 显式关闭数据库，确保 fast 档的 WAL 回写与 PRAGMA optimize 在退出前执行
+        scanner.storage.close()
+        scanner.client.close()
 
 
 if __name__ == "__main__":
@@ -5,11 +5,21 @@ from __future__ import annotations
 import json
 import logging
 import os
+import re
 from dataclasses import dataclass, field
-from typing import Dict, List
+from typing import Dict, List, Mapping
 
 
-def _normalize_path(path: str) -> str:
+# 匹配 .env 中的 KEY=VALUE 行，VALUE 可用单/双引号包裹；注释行与无等号的行自然不会命中
+_DOTENV_LINE = re.compile(
+    r"""^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(?:"([^"\n]*)"|'([^'\n]*)'|(.*?))[ \t]*$""",
+    re.MULTILINE,
+)
+
+
+def normalize_path(path: str) -> str:
+    """规范化 WebDAV 路径：去除首尾空白，补齐前导斜杠并去掉末尾斜杠。"""
+
     path = path.strip()
     if not path:
         return ""
@@ -20,8 +30,8 @@ def _normalize_path(path: str) -> str:
     return path
 
 
-def _env_bool(name: str, default: bool) -> bool:
-    value = os.getenv(name)
+def _env_bool(env: Mapping[str, str], name: str, default: bool) -> bool:
+    value = env.get(name)
     if value is None:
         return default
     return value.lower() == "true"
@@ -39,17 +49,34 @@ class Config:
     video_exts: List[str]
     lang_rules: Dict[str, List[str]]
     only_new: bool  # 是否仅处理新增文件
-    state_file: str
+    state_file: str  # 旧版状态文件，仅在数据库没有已见记录时导入一次
     timeout: int
     log_level: str
     database_file: str
+    # SQLite 始终以 WAL 模式打开，旁边会多出 -wal/-shm 文件；持久性档位决定提交时的落盘策略：
+    # - full：synchronous=FULL，每次提交都 fsync，断电也不会丢失已提交的数据；
+    # - normal：synchronous=NORMAL，提交无需每次 fsync，断电最多丢失最近几次提交，数据库文件不会损坏；
+    # - fast：synchronous=OFF 并关闭自动检查点，WAL 在 close() 时统一回写主库；进程异常退出不丢数据，
+    #   但系统崩溃或断电可能丢失本次写入乃至损坏数据库文件，需删除后重新扫描重建
+    database_durability: str
     scan_cache_hours: int
     skip_paths_file: str
     skip_paths: List[str]
+    dir_skip_pattern: str  # 目录名（不含上级路径）匹配该正则时整个子树都不遍历，为空则不剪枝
     env_file: str
     tmdb_api_key: str
     metadata_cache_hours: int
+    metadata_airing_cache_hours: int  # 连载中剧集的元数据缓存时长，取两者中较短者
+    metadata_concurrency: int  # 同时进行的 TMDB 请求数上限
+    concurrency: int  # 同时进行的 PROPFIND 请求数上限
+    depth_infinity: bool  # 是否先尝试以 Depth: infinity 一次取回整个剧集目录
     raw_environment: Dict[str, str] = field(default_factory=dict)
+    log_level_int: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        # 统一在此解析日志级别，未知取值回退到 INFO
+        level = getattr(logging, self.log_level.strip().upper(), logging.INFO)
+        self.log_level_int = level if isinstance(level, int) else logging.INFO
 
     @classmethod
     def from_env(cls) -> "Config":
@@ -71,48 +98,87 @@ class Config:
             "WEBDAV_TIMEOUT": "20",
             "WEBDAV_ONLY_NEW": "true",
             "WEBDAV_DB_FILE": "./alist_scaner.db",
+            "WEBDAV_DB_DURABILITY": "normal",
             "WEBDAV_SCAN_CACHE_HOURS": "24",
             "WEBDAV_SKIP_PATHS_FILE": "./skip_paths.json",
+            "WEBDAV_DIR_SKIP_PATTERN": r"^(?:@eaDir|#recycle|\.recycle|\.@__thumb|metadata|\.?thumbnails)$",
             "WEBDAV_ENV_FILE": env_file,
             "TMDB_API_KEY": "",
             "METADATA_CACHE_HOURS": "0",
+            "METADATA_AIRING_CACHE_HOURS": "24",
+            "WEBDAV_CONCURRENCY": "4",
+            "WEBDAV_DEPTH_INFINITY": "false",
+            "METADATA_CONCURRENCY": "8",
         }
 
         # 兼容旧脚本——缺省时直接把默认值写入环境变量，方便外部复用
         for key, value in defaults.items():
             os.environ.setdefault(key, value)
 
-        env_snapshot = {key: os.getenv(key, defaults.get(key, "")) for key in defaults}
+        # 此后只读这份普通 dict 快照，避免反复经过 os.environ 的编解码包装
+        env = dict(os.environ)
+        env_snapshot = {key: env.get(key, value) for key, value in defaults.items()}
 
         # ROOTS 依旧采用 JSON 字符串配置，兼容原脚本的环境变量写法
         try:
-            roots = json.loads(os.getenv("WEBDAV_ROOTS", defaults["WEBDAV_ROOTS"]))
+            roots = json.loads(env.get("WEBDAV_ROOTS", defaults["WEBDAV_ROOTS"]))
         except json.JSONDecodeError as exc:
             raise ValueError("WEBDAV_ROOTS 必须为 JSON 列表字符串") from exc
 
         if not isinstance(roots, list) or not all(isinstance(item, str) for item in roots):
             raise ValueError("WEBDAV_ROOTS 需要是字符串数组，例如 ['美剧路径', '日剧路径']")
 
-        only_new_env = os.getenv("WEBDAV_ONLY_NEW", defaults["WEBDAV_ONLY_NEW"])
+        only_new_env = env.get("WEBDAV_ONLY_NEW", defaults["WEBDAV_ONLY_NEW"])
         try:
-            timeout = int(os.getenv("WEBDAV_TIMEOUT", defaults["WEBDAV_TIMEOUT"]))
+            timeout = int(env.get("WEBDAV_TIMEOUT", defaults["WEBDAV_TIMEOUT"]))
         except ValueError as exc:
             raise ValueError("WEBDAV_TIMEOUT 必须是整数秒数") from exc
         try:
             scan_cache_hours = int(
-                os.getenv("WEBDAV_SCAN_CACHE_HOURS", defaults["WEBDAV_SCAN_CACHE_HOURS"])
+                env.get("WEBDAV_SCAN_CACHE_HOURS", defaults["WEBDAV_SCAN_CACHE_HOURS"])
             )
         except ValueError as exc:
             raise ValueError("WEBDAV_SCAN_CACHE_HOURS 必须是整数小时") from exc
 
         try:
             metadata_cache_hours = int(
-                os.getenv("METADATA_CACHE_HOURS", defaults["METADATA_CACHE_HOURS"])
+                env.get("METADATA_CACHE_HOURS", defaults["METADATA_CACHE_HOURS"])
             )
         except ValueError as exc:
             raise ValueError("METADATA_CACHE_HOURS 必须是整数小时") from exc
 
-        skip_paths_file = os.getenv(
+        try:
+            concurrency = int(env.get("WEBDAV_CONCURRENCY", defaults["WEBDAV_CONCURRENCY"]))
+        except ValueError as exc:
+            raise ValueError("WEBDAV_CONCURRENCY 必须是整数") from exc
+
+        try:
+            metadata_airing_cache_hours = int(
+                env.get("METADATA_AIRING_CACHE_HOURS", defaults["METADATA_AIRING_CACHE_HOURS"])
+            )
+        except ValueError as exc:
+            raise ValueError("METADATA_AIRING_CACHE_HOURS 必须是整数小时") from exc
+
+        try:
+            metadata_concurrency = int(
+                env.get("METADATA_CONCURRENCY", defaults["METADATA_CONCURRENCY"])
+            )
+        except ValueError as exc:
+            raise ValueError("METADATA_CONCURRENCY 必须是整数") from exc
+
+        database_durability = (
+            env.get("WEBDAV_DB_DURABILITY", defaults["WEBDAV_DB_DURABILITY"]).strip().lower()
+        )
+        if database_durability not in ("full", "normal", "fast"):
+            raise ValueError("WEBDAV_DB_DURABILITY 只能是 full、normal 或 fast")
+
+        dir_skip_pattern = env.get("WEBDAV_DIR_SKIP_PATTERN", defaults["WEBDAV_DIR_SKIP_PATTERN"])
+        try:
+            re.compile(dir_skip_pattern)
+        except re.error as exc:
+            raise ValueError(f"WEBDAV_DIR_SKIP_PATTERN 不是合法的正则表达式：{exc}") from exc
+
+        skip_paths_file = env.get(
             "WEBDAV_SKIP_PATHS_FILE", defaults["WEBDAV_SKIP_PATHS_FILE"]
         )
         skip_paths: List[str] = []
@@ -127,11 +193,11 @@ class Config:
                 raise OSError(f"无法读取跳过目录配置文件 {skip_paths_file}: {exc}") from exc
 
         config = cls(
-            webdav_base=os.getenv("WEBDAV_BASE", defaults["WEBDAV_BASE"]),
-            username=os.getenv("WEBDAV_USER", defaults["WEBDAV_USER"]),
-            password=os.getenv("WEBDAV_PASS", defaults["WEBDAV_PASS"]),
+            webdav_base=env.get("WEBDAV_BASE", defaults["WEBDAV_BASE"]),
+            username=env.get("WEBDAV_USER", defaults["WEBDAV_USER"]),
+            password=env.get("WEBDAV_PASS", defaults["WEBDAV_PASS"]),
             roots=[root if root.startswith("/") else f"/{root}" for root in roots],
-            verify_ssl=_env_bool("WEBDAV_VERIFY_SSL", defaults["WEBDAV_VERIFY_SSL"].lower() == "true"),
+            verify_ssl=_env_bool(env, "WEBDAV_VERIFY_SSL", defaults["WEBDAV_VERIFY_SSL"].lower() == "true"),
             video_exts=[".mp4", ".mkv", ".avi", ".mov", ".ts", ".m4v", ".wmv", ".webm"],
             lang_rules={
                 "美剧": [
@@ -151,22 +217,28 @@ class Config:
                 ],
             },
             only_new=only_new_env.lower() != "false",
-            state_file=os.getenv("WEBDAV_STATE_FILE", defaults["WEBDAV_STATE_FILE"]),
+            state_file=env.get("WEBDAV_STATE_FILE", defaults["WEBDAV_STATE_FILE"]),
             timeout=timeout,
-            log_level=os.getenv("LOG_LEVEL", defaults["LOG_LEVEL"]),
-            database_file=os.getenv("WEBDAV_DB_FILE", defaults["WEBDAV_DB_FILE"]),
+            log_level=env.get("LOG_LEVEL", defaults["LOG_LEVEL"]),
+            database_file=env.get("WEBDAV_DB_FILE", defaults["WEBDAV_DB_FILE"]),
+            database_durability=database_durability,
             scan_cache_hours=scan_cache_hours,
             skip_paths_file=skip_paths_file,
             skip_paths=skip_paths,
+            dir_skip_pattern=dir_skip_pattern,
             env_file=env_file,
-            tmdb_api_key=os.getenv("TMDB_API_KEY", defaults["TMDB_API_KEY"]),
+            tmdb_api_key=env.get("TMDB_API_KEY", defaults["TMDB_API_KEY"]),
             metadata_cache_hours=metadata_cache_hours,
+            metadata_airing_cache_hours=metadata_airing_cache_hours,
+            metadata_concurrency=max(metadata_concurrency, 1),
+            concurrency=max(concurrency, 1),
+            depth_infinity=_env_bool(env, "WEBDAV_DEPTH_INFINITY", False),
             raw_environment=env_snapshot,
         )
 
         # 在此初始化基础日志配置，方便 CLI 或其他入口复用
         logging.basicConfig(
-            level=getattr(logging, config.log_level.upper(), logging.INFO),
+            level=config.log_level_int,
             format="[%(asctime)s] %(levelname)s: %(message)s",
         )
 
@@ -182,7 +254,7 @@ class Config:
             raise ValueError("跳过目录配置文件需要是字符串列表 JSON，例如 ['路径1', '路径2']")
         normalized: List[str] = []
         for item in data:
-            normalized_path = _normalize_path(item)
+            normalized_path = normalize_path(item)
             if not normalized_path:
                 continue
             normalized.append(normalized_path)
@@ -194,19 +266,15 @@ class Config:
             return
         try:
             with open(file_path, "r", encoding="utf-8") as fp:
-                for line in fp:
-                    stripped = line.strip()
-                    if not stripped or stripped.startswith("#"):
-                        continue
-                    if "=" not in stripped:
-                        continue
-                    key, value = stripped.split("=", 1)
-                    key = key.strip()
-                    value = value.strip().strip('"').strip("'")
-                    if not key:
-                        continue
-                    # 若环境变量已存在，优先保留外部传入的值
-                    os.environ.setdefault(key, value)
+                text = fp.read()
         except OSError:
             # 静默忽略读取失败，后续会沿用默认值
             return
+
+        pending: Dict[str, str] = {}
+        for key, double_quoted, single_quoted, plain in _DOTENV_LINE.findall(text):
+            # 若环境变量已存在，优先保留外部传入的值；文件内重复的键以首次出现为准
+            if key in os.environ or key in pending:
+                continue
+            pending[key] = double_quoted or single_quoted or plain
+        os.environ.update(pending)
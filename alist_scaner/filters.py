@@ -3,26 +3,41 @@
 from __future__ import annotations
 
 import re
-from dataclasses import dataclass
 from typing import Dict, Iterable, Optional
 
 
-@dataclass
 class EpisodeFilter:
     """负责判断文件是否为目标剧集。"""
 
-    video_exts: Iterable[str]
-    lang_rules: Dict[str, Iterable[str]]
+    def __init__(self, video_exts: Iterable[str], lang_rules: Dict[str, Iterable[str]]) -> None:
+        self.video_exts = list(video_exts)
+        self.lang_rules = {lang: list(patterns) for lang, patterns in lang_rules.items()}
+        # str.endswith 接受元组，一次 C 调用即可完成全部后缀比较
+        self._video_exts = tuple(ext.lower() for ext in self.video_exts)
+        # 只需比较文件名末尾不超过最长扩展名的部分，不必把整个（往往很长的中文）文件名转小写
+        self._ext_tail = max((len(ext) for ext in self._video_exts), default=0)
+        # 中文语言名不是合法的分组名，这里映射为 lang0、lang1 …
+        self._group_to_lang: Dict[str, str] = {}
+        groups = []
+        for index, (lang, patterns) in enumerate(self.lang_rules.items()):
+            if not patterns:
+                continue
+            group = f"lang{index}"
+            self._group_to_lang[group] = lang
+            # 每个分组以 .*? 起头并配合 match 使用：先在整串中尝试前一种语言的全部规则，
+            # 失败后才回退到下一种语言，保持与逐条 re.search 相同的优先级
+            groups.append(f"(?P<{group}>.*?(?:{'|'.join(patterns)}))")
+        self._combined = re.compile("|".join(groups), re.IGNORECASE | re.DOTALL) if groups else None
 
     def is_video(self, filename: str) -> bool:
         # 仅根据扩展名识别视频文件，保持逻辑简单明了
-        lower = filename.lower()
-        return any(lower.endswith(ext) for ext in self.video_exts)
+        return filename[-self._ext_tail:].lower().endswith(self._video_exts)
 
     def detect_lang(self, path_or_name: str) -> Optional[str]:
         # 允许在完整路径或文件名中命中语言关键字
-        for lang, patterns in self.lang_rules.items():
-            for pattern in patterns:
-                if re.search(pattern, path_or_name, flags=re.IGNORECASE):
-                    return lang
-        return None
+        if self._combined is None:
+            return None
+        match = self._combined.match(path_or_name)
+        if match is None:
+            return None
+        return self._group_to_lang[match.lastgroup]
@@ -4,12 +4,20 @@ from __future__ import annotations
 
 import logging
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .models import ShowMetadata
 
+# 按剧集语言依次尝试的 TMDB 语言代码，已按优先级排好且无重复
+_LANGUAGE_CANDIDATES: Dict[str, Tuple[str, ...]] = {
+    "日剧": ("zh-CN", "ja-JP"),
+    "美剧": ("zh-CN", "en-US"),
+}
+_DEFAULT_LANGUAGE_CANDIDATES: Tuple[str, ...] = ("zh-CN", "en-US")
+
 
 def derive_title_from_path(show_path: str) -> str:
     """根据剧集目录路径推导剧名。"""
@@ -19,7 +27,7 @@ def derive_title_from_path(show_path: str) -> str:
     normalized = show_path.rstrip("/")
     if not normalized:
         return ""
-    return normalized.split("/")[-1]
+    return normalized.rpartition("/")[2]
 
 
 @dataclass
@@ -28,6 +36,7 @@ class ShowMetadataFetcher:
 
     api_key: str
     session: Optional[requests.Session] = None
+    pool_size: int = 8
 
     _TMDB_BASE: str = "https://api.themoviedb.org/3"
 
@@ -36,6 +45,9 @@ class ShowMetadataFetcher:
             raise ValueError("TMDB API key is required for metadata fetching")
         if self.session is None:
             self.session = requests.Session()
+            # 多线程并发抓取时复用同一批 keep-alive 连接，避免每个请求重新握手
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.pool_size, 1))
+            self.session.mount("https://", adapter)
 
     def fetch(self, title: str, lang: str) -> Optional[ShowMetadata]:
         """根据剧名和语言抓取评分、简介与类型信息。"""
@@ -91,6 +103,7 @@ class ShowMetadataFetcher:
                 overview=detail_payload.get("overview") or best_match.get("overview"),
                 genres=genres,
                 source="tmdb",
+                in_production=self._extract_in_production(detail_payload),
             )
             if metadata.overview or metadata.rating is not None or metadata.genres:
                 return metadata
@@ -98,20 +111,8 @@ class ShowMetadataFetcher:
         logging.info("TMDB 未找到剧集元数据：%s", title)
         return None
 
-    def _language_candidates(self, lang: str) -> List[str]:
-        mapping = {
-            "日剧": ["zh-CN", "ja-JP"],
-            "美剧": ["zh-CN", "en-US"],
-        }
-        candidates = mapping.get(lang, ["zh-CN", "en-US"])
-        # 去重同时保持顺序
-        seen = set()
-        ordered: List[str] = []
-        for item in candidates:
-            if item not in seen:
-                ordered.append(item)
-                seen.add(item)
-        return ordered
+    def _language_candidates(self, lang: str) -> Tuple[str, ...]:
+        return _LANGUAGE_CANDIDATES.get(lang, _DEFAULT_LANGUAGE_CANDIDATES)
 
     def _request(self, path: str, params: Optional[dict] = None) -> dict:
         query = {"api_key": self.api_key}
@@ -122,6 +123,13 @@ class ShowMetadataFetcher:
         response.raise_for_status()
         return response.json()
 
+    @staticmethod
+    def _extract_in_production(payload: dict) -> Optional[bool]:
+        value = payload.get("in_production")
+        if isinstance(value, bool):
+            return value
+        return None
+
     @staticmethod
     def _extract_rating(payload: dict) -> Optional[float]:
         rating = payload.get("vote_average")
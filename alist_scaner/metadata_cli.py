@@ -17,8 +17,11 @@ def build_metadata_updater() -> MetadataUpdater:
     if not config.tmdb_api_key:
         raise RuntimeError("未配置 TMDB_API_KEY，无法抓取剧集元数据。")
 
-    storage = SQLiteStore(config.database_file)
-    fetcher = ShowMetadataFetcher(api_key=config.tmdb_api_key)
+    storage = SQLiteStore(config.database_file, durability=config.database_durability)
+    fetcher = ShowMetadataFetcher(
+        api_key=config.tmdb_api_key,
+        pool_size=config.metadata_concurrency,
+    )
     return MetadataUpdater(config=config, storage=storage, fetcher=fetcher)
 
 
@@ -29,7 +32,10 @@ def main() -> None:
         logging.error("%s", exc)
         return
 
-    updater.run()
+    try:
+        updater.run()
+    finally:
+        updater.storage.close()
 
 
 if __name__ == "__main__":
@@ -4,15 +4,20 @@ from __future__ import annotations
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Iterable
+from typing import Iterable, List, Optional, Tuple
 
 from .config import Config
 from .metadata import ShowMetadataFetcher, derive_title_from_path
+from .models import ShowMetadata
 from .storage import SQLiteStore
 
+# 抓取结果累计多少条后合并成一个事务写入数据库
+_WRITE_BATCH_SIZE = 32
 
-@dataclass
+
+@dataclass(slots=True)
 class ShowEntry:
     """代表一个待抓取元数据的剧集。"""
 
@@ -28,6 +33,8 @@ class MetadataUpdater:
         self.storage = storage
         self.fetcher = fetcher
         self._cache_ttl = max(self.config.metadata_cache_hours, 0) * 3600
+        self._airing_cache_ttl = max(self.config.metadata_airing_cache_hours, 0) * 3600
+        self._workers = max(self.config.metadata_concurrency, 1)
 
     def run(self) -> None:
         shows = list(self._iter_shows())
@@ -39,6 +46,8 @@ class MetadataUpdater:
         skipped = 0
         failed = 0
 
+        # 缓存判断在当前线程完成，只把网络请求交给线程池
+        pending: List[Tuple[ShowEntry, str, str]] = []
         for entry in shows:
             if not self._should_fetch(entry.show_path):
                 skipped += 1
@@ -50,22 +59,42 @@ class MetadataUpdater:
                 skipped += 1
                 continue
 
-            lang_hint = entry.lang or "美剧"
-            metadata = self.fetcher.fetch(title=title, lang=lang_hint)
-            if not metadata:
-                failed += 1
-                continue
-
-            metadata.show_path = entry.show_path
-            metadata.lang = lang_hint
-            self.storage.upsert_show_metadata(metadata)
-            updated += 1
-
-            logging.info(
-                "已更新《%s》(%s) 的元数据。",
-                metadata.title or title,
-                entry.show_path,
-            )
+            pending.append((entry, title, entry.lang or "美剧"))
+
+        # 先直接沿用仍在有效期内的缓存，只有过期条目才会发起请求
+        logging.info("元数据缓存命中 %s 个剧集，待刷新 %s 个。", skipped, len(pending))
+
+        with ThreadPoolExecutor(
+            max_workers=self._workers,
+            thread_name_prefix="metadata-fetch",
+        ) as executor:
+            futures = {
+                executor.submit(self.fetcher.fetch, title=title, lang=lang_hint): (entry, title, lang_hint)
+                for entry, title, lang_hint in pending
+            }
+            ready: List[ShowMetadata] = []
+            for future in as_completed(futures):
+                entry, title, lang_hint = futures[future]
+                metadata = future.result()
+                if not metadata:
+                    failed += 1
+                    continue
+
+                metadata.show_path = entry.show_path
+                metadata.lang = lang_hint
+                ready.append(metadata)
+                updated += 1
+
+                logging.info(
+                    "已更新《%s》(%s) 的元数据。",
+                    metadata.title or title,
+                    entry.show_path,
+                )
+                if len(ready) >= _WRITE_BATCH_SIZE:
+                    self._write_batch(ready)
+                    ready = []
+
+            self._write_batch(ready)
 
         logging.info(
             "元数据抓取完成：总计 %s，更新 %s，跳过 %s，失败 %s。",
@@ -75,6 +104,14 @@ class MetadataUpdater:
             failed,
         )
 
+    def _write_batch(self, batch: List[ShowMetadata]) -> None:
+        # 攒够一批再写入，一次事务提交多条；等待网络期间不持有写锁
+        if not batch:
+            return
+        with self.storage.transaction():
+            for metadata in batch:
+                self.storage.upsert_show_metadata(metadata)
+
     def _iter_shows(self) -> Iterable[ShowEntry]:
         for show_path, lang in self.storage.iter_show_entries():
             yield ShowEntry(show_path=show_path, lang=lang)
@@ -84,12 +121,19 @@ class MetadataUpdater:
         if cached is None:
             return True
 
-        needs_refresh = cached.rating is None or not cached.overview or not cached.genres
-        if needs_refresh:
-            return True
-
-        # if self._cache_ttl <= 0:
-        #     return False
-
+        ttl = self._ttl_for(cached)
+        if ttl is None:
+            return False
         age = int(time.time()) - cached.updated_at
-        return age >= self._cache_ttl
+        return age >= ttl
+
+    def _ttl_for(self, cached: ShowMetadata) -> Optional[int]:
+        """返回缓存有效期（秒），``None`` 表示永不过期；取值 <= 0 的配置视为不自动刷新。"""
+
+        ttls = [self._cache_ttl] if self._cache_ttl > 0 else []
+        incomplete = cached.rating is None or not cached.overview or not cached.genres
+        if cached.in_production or incomplete:
+            # 连载中或信息不完整的剧集更可能变化，在已启用的缓存周期中取较短者
+            if self._airing_cache_ttl > 0:
+                ttls.append(self._airing_cache_ttl)
+        return min(ttls) if ttls else None
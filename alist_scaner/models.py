@@ -6,7 +6,7 @@ from dataclasses import dataclass, field
 from typing import List, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class WebDAVResource:
     """表示一次 PROPFIND 返回的资源。"""
 
@@ -17,7 +17,7 @@ class WebDAVResource:
     etag: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Episode:
     """匹配到的剧集文件。"""
 
@@ -48,7 +48,7 @@ class Episode:
         return data
 
 
-@dataclass
+@dataclass(slots=True)
 class ShowMetadata:
     """剧集在第三方元数据服务中的补充信息。"""
 
@@ -60,3 +60,4 @@ class ShowMetadata:
     genres: List[str] = field(default_factory=list)
     source: str = ""
     updated_at: int = 0
+    in_production: Optional[bool] = None  # 是否仍在连载，决定缓存刷新周期
@@ -2,35 +2,68 @@
 
 from __future__ import annotations
 
+import codecs
 import json
 import logging
-import os
-from dataclasses import dataclass
-from typing import Iterable, Iterator, List, Optional, Tuple
+import re
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .config import Config
+try:  # orjson 为可选依赖，缺失时回退到标准库 json
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+from .config import Config, normalize_path
 from .filters import EpisodeFilter
 from .models import Episode, WebDAVResource
 from .state import StateStore
-from .storage import SQLiteStore
+from .storage import SQLiteStore, is_scan_cache_fresh
 from .webdav import WebDAVClient
 
 
 ShowBatch = Tuple[str, Optional[str], List[Episode]]
 
+# 累计攒下多少条剧集后写入数据库一次，每次写入一个短事务
+_FLUSH_EVERY_EPISODES = 5000
+# 需要输出的目标语言
+_TARGET_LANGS = frozenset({"美剧", "日剧"})
+
+
+def _stdout_is_utf8() -> bool:
+    encoding = getattr(sys.stdout, "encoding", None)
+    if not encoding:
+        return False
+    try:
+        return codecs.lookup(encoding).name == "utf-8"
+    except LookupError:
+        return False
+
 
-def _normalize_path(path: str) -> str:
-    if not path:
-        return ""
-    path = path.strip()
-    if not path.startswith("/"):
-        path = f"/{path}"
-    if len(path) > 1:
-        path = path.rstrip("/")
-    return path or "/"
+def _write_payload(payload: List[dict]) -> None:
+    """将扫描结果以缩进 JSON 写到标准输出。"""
+
+    buffer = getattr(sys.stdout, "buffer", None)
+    if orjson is None or buffer is None or not _stdout_is_utf8():
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+        return
+    # orjson 在 C 层直接产出 UTF-8 字节，省去 ensure_ascii=False 的纯 Python 编码路径；
+    # 仅当标准输出本身就是 UTF-8 时才绕过文本层，否则（如 Windows 的 cp936 管道）交给 print 按其编码输出
+    sys.stdout.flush()
+    buffer.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    buffer.write(b"\n")
+    buffer.flush()
 
 
-@dataclass
+# 与跳过目录配置共用同一套规范化规则；扫描时同一路径会被反复判断，结果加以缓存
+_normalize_path = lru_cache(maxsize=4096)(normalize_path)
+
+
+@dataclass(slots=True)
 class EpisodeScanner:
     """负责 orchestrate WebDAV 扫描流程。"""
 
@@ -39,6 +72,20 @@ class EpisodeScanner:
     state: StateStore
     filter: EpisodeFilter
     storage: SQLiteStore
+    _skip_re: Optional[re.Pattern] = field(init=False, repr=False)
+    _dir_skip_re: Optional[re.Pattern] = field(init=False, repr=False)
+    _dir_lang_cache: Dict[str, Optional[str]] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._dir_lang_cache = {}
+        # 所有跳过目录合并成一条锚定正则：命中自身或其任意子路径
+        self._skip_re = None
+        if self.config.skip_paths:
+            self._skip_re = re.compile(
+                "^(?:" + "|".join(re.escape(path) for path in self.config.skip_paths) + ")(?:/|$)"
+            )
+        pattern = self.config.dir_skip_pattern
+        self._dir_skip_re = re.compile(pattern, re.IGNORECASE) if pattern else None
 
     @property
     def _cache_ttl_seconds(self) -> int:
@@ -48,62 +95,129 @@ class EpisodeScanner:
     def run(self) -> None:
         logging.info("开始扫描 WebDAV（小雅 Alist）...")
 
-        state_cache = self.state.load()
-        first_run = not bool(state_cache)
+        self._import_legacy_state()
+        first_run = not self.storage.has_seen_episodes()
         if first_run and self.config.only_new:
             logging.info("首次运行：为了避免把历史内容都当作新增，本次不输出新增清单。")
         all_new: List[Episode] = []
         all_episodes: List[Episode] = []
 
-        for cache_key, lastmod, episodes in self._iter_show_batches():
-            if not episodes:
-                self.storage.mark_directory_scanned(cache_key, lastmod)
-                continue
-
-            new_eps: List[Episode] = []
-            for episode in episodes:
-                is_new = self.state.detect_new(episode)
-                if is_new and not first_run:
-                    episode.is_new = True
-                    new_eps.append(episode)
-                self.state.mark_seen(episode)
-
-            self.state.save()
-            self.storage.upsert_episodes(episodes)
-            self.storage.mark_directory_scanned(cache_key, lastmod)
-
-            if self.config.only_new:
-                all_new.extend(new_eps)
-            else:
-                all_episodes.extend(episodes)
-
-            logging.debug(
-                "剧集目录 %s 扫描完成，新增 %s 条，全部 %s 条。",
-                episodes[0].show_path if episodes else cache_key,
-                len(new_eps),
-                len(episodes),
-            )
+        # 写锁只在落库时短暂持有：遍历期间不开事务，攒够一定条数的剧集后在一个短事务内写入，
+        # 避免扫描途中等待 PROPFIND 时长时间占住写锁，使同时运行的 metadata_cli 报 database is locked
+        pending: List[ShowBatch] = []
+        pending_episodes = 0
+        for batch in self._iter_show_batches():
+            pending.append(batch)
+            pending_episodes += len(batch[2])
+            if pending_episodes >= _FLUSH_EVERY_EPISODES:
+                all_new.extend(self._write_batches(pending, first_run))
+                pending = []
+                pending_episodes = 0
+            if not self.config.only_new:
+                all_episodes.extend(batch[2])
+        all_new.extend(self._write_batches(pending, first_run))
 
         if self.config.only_new:
             payload = [episode.to_dict(include_is_new=True) for episode in all_new]
         else:
             payload = [episode.to_dict(include_is_new=True) for episode in all_episodes]
 
-        print(json.dumps(payload, ensure_ascii=False, indent=2))
+        _write_payload(payload)
 
         logging.info(
             "扫描流程完成，输出 %s 条记录。",
             len(payload),
         )
 
+    def _write_batches(self, batches: List[ShowBatch], first_run: bool) -> List[Episode]:
+        """在一个事务内写入攒下的剧集目录结果，返回其中的新增剧集。"""
+
+        all_new: List[Episode] = []
+        if not batches:
+            return all_new
+        with self.storage.transaction():
+            for cache_key, lastmod, episodes in batches:
+                if not episodes:
+                    self.storage.mark_directory_scanned(cache_key, lastmod)
+                    continue
+
+                new_eps: List[Episode] = []
+                if not first_run:
+                    # 整个剧集目录的已见路径一次查回，代替逐条查询
+                    seen = self.storage.seen_episode_paths(episode.path for episode in episodes)
+                    new_eps = [episode for episode in episodes if episode.path not in seen]
+                    for episode in new_eps:
+                        episode.is_new = True
+
+                self.storage.mark_seen_many(episodes)
+                self.storage.upsert_episodes(episodes)
+                self.storage.mark_directory_scanned(cache_key, lastmod)
+                all_new.extend(new_eps)
+
+                logging.debug(
+                    "剧集目录 %s 扫描完成，新增 %s 条，全部 %s 条。",
+                    episodes[0].show_path,
+                    len(new_eps),
+                    len(episodes),
+                )
+        return all_new
+
+    def _import_legacy_state(self) -> None:
+        """数据库尚无已见记录时，一次性导入旧版 state.json。"""
+
+        if self.storage.has_seen_episodes():
+            return
+        legacy = self.state.load()
+        if not legacy:
+            return
+        imported = self.storage.import_seen_state(legacy)
+        logging.info("已从 %s 导入 %s 条历史状态到数据库。", self.state.path, imported)
+
     def _iter_show_batches(self) -> Iterator[ShowBatch]:
         """按照剧集目录逐个返回扫描结果。"""
 
+        workers = max(self.config.concurrency, 1)
+        if workers == 1:
+            for entry, show_path in self._iter_scan_targets():
+                yield self._scan_target(entry, show_path)
+            return
+
+        # 剧集目录之间互不依赖，交给线程池并发遍历；缓存判断与数据库读写仍留在当前线程。
+        # 按提交顺序取回结果，输出顺序与串行扫描一致；在途任务限制在固定窗口内，
+        # 队首目录较慢时，后面已完成的结果最多积压一个窗口，内存不随剧集目录总数增长
+        window_size = 2 * workers
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="show-scan") as executor:
+            window: Deque[Future] = deque()
+            for entry, show_path in self._iter_scan_targets(executor):
+                window.append(executor.submit(self._scan_target, entry, show_path))
+                if len(window) >= window_size:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+    def _iter_scan_targets(
+        self,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ) -> Iterator[Tuple[WebDAVResource, str]]:
+        """列出各根目录下需要扫描的剧集目录（或文件）及其 show_path。"""
+
+        roots: List[str] = []
         for root in self.config.roots:
             if self._is_path_skipped(root):
                 logging.info("配置跳过根目录：%s", root)
                 continue
-            entries = self.client.list_directory(root, depth=1)
+            roots.append(root)
+
+        # 缓存判断只读一次 shows 表快照，避免每个候选目录单独查询；TTL 关闭时缓存从不生效
+        cache_ttl = self._cache_ttl_seconds
+        shows_state = self.storage.load_shows_state() if cache_ttl > 0 else {}
+
+        if executor is not None:
+            listings = executor.map(lambda root: self.client.list_directory(root, depth=1), roots)
+        else:
+            listings = (self.client.list_directory(root, depth=1) for root in roots)
+
+        for root, entries in zip(roots, listings):
             for entry in entries:
                 if entry.path.rstrip("/") == root.rstrip("/"):
                     continue
@@ -111,41 +225,72 @@ class EpisodeScanner:
                 if self._is_path_skipped(entry.path):
                     logging.debug("配置跳过路径：%s", entry.path)
                     continue
+                if entry.is_dir and self._is_dir_pruned(entry.path):
+                    logging.debug("剪除目录：%s", entry.path)
+                    continue
 
                 if entry.is_dir:
-                    if self._should_skip_directory(entry):
+                    if self._should_skip_directory(entry, shows_state, cache_ttl):
                         logging.debug("命中缓存，跳过目录：%s", entry.path)
                         continue
-
-                    resources = self.client.walk([entry.path])
-                    episodes = self._collect_episodes(resources, show_path=entry.path)
-                    yield (entry.path, entry.lastmod, episodes)
+                    yield (entry, entry.path)
                 else:
-                    if self._should_skip_directory(entry):
+                    if self._should_skip_directory(entry, shows_state, cache_ttl):
                         logging.debug("命中缓存，跳过文件：%s", entry.path)
                         continue
                     # 根目录下直接存在的文件，视为 show_path 的父目录
-                    parent_path = os.path.dirname(entry.path) or "/"
-                    episodes = self._collect_episodes([entry], show_path=parent_path)
-                    yield (entry.path, entry.lastmod, episodes)
-
-    def _should_skip_directory(self, resource: WebDAVResource) -> bool:
-        return self.storage.should_skip_scan(
-            path=resource.path,
-            remote_lastmod=resource.lastmod,
-            cache_ttl_seconds=self._cache_ttl_seconds,
+                    yield (entry, entry.path.rpartition("/")[0] or "/")
+
+    def _scan_target(self, entry: WebDAVResource, show_path: str) -> ShowBatch:
+        if entry.is_dir:
+            resources: Iterable[WebDAVResource] = self.client.walk(
+                [entry.path], skip_dir=self._should_prune_directory
+            )
+        else:
+            resources = [entry]
+        episodes = self._collect_episodes(resources, show_path=show_path)
+        return (entry.path, entry.lastmod, episodes)
+
+    def _should_skip_directory(
+        self,
+        resource: WebDAVResource,
+        shows_state: Dict[str, Tuple[int, str]],
+        cache_ttl_seconds: int,
+    ) -> bool:
+        cached = shows_state.get(resource.path)
+        if cached is None:
+            return False
+        last_scan_ts, last_remote_lastmod = cached
+        return is_scan_cache_fresh(
+            last_scan_ts,
+            last_remote_lastmod,
+            resource.lastmod,
+            cache_ttl_seconds,
         )
 
     def _is_path_skipped(self, path: str) -> bool:
-        normalized = _normalize_path(path)
-        if not normalized:
+        if self._skip_re is None:
             return False
-        for skip in self.config.skip_paths:
-            if normalized == skip:
-                return True
-            if normalized.startswith(f"{skip}/"):
-                return True
-        return False
+        return self._skip_re.match(_normalize_path(path)) is not None
+
+    def _is_dir_pruned(self, path: str) -> bool:
+        # 只匹配目录自身的名称；按完整路径匹配时，位于 metadata 等目录之下的根目录会整棵落空
+        if self._dir_skip_re is None:
+            return False
+        name = path.rstrip("/").rpartition("/")[2]
+        return self._dir_skip_re.search(name) is not None
+
+    def _should_prune_directory(self, path: str) -> bool:
+        # 遍历时直接剪掉配置跳过的目录和无关目录，省去整棵子树的 PROPFIND
+        return self._is_path_skipped(path) or self._is_dir_pruned(path)
+
+    def _detect_lang(self, dir_path: str, filename: str) -> Optional[str]:
+        # 同一剧集目录下的文件语言一致，目录部分只匹配一次；目录未命中时再看文件名
+        try:
+            dir_lang = self._dir_lang_cache[dir_path]
+        except KeyError:
+            dir_lang = self._dir_lang_cache.setdefault(dir_path, self.filter.detect_lang(dir_path))
+        return dir_lang or self.filter.detect_lang(filename)
 
     def _collect_episodes(
         self,
@@ -156,16 +301,17 @@ class EpisodeScanner:
         for item in resources:
             if item.is_dir:
                 continue
+            # 先做最廉价的扩展名判断，nfo/jpg/srt 等杂项文件在这里就被排除
+            dir_path, _, filename = item.path.rpartition("/")
+            if not self.filter.is_video(filename):
+                continue
             if self._is_path_skipped(item.path):
                 logging.debug("配置跳过文件：%s", item.path)
                 continue
-            filename = item.path.split("/")[-1]
-            if not self.filter.is_video(filename):
-                continue
-            lang = self.filter.detect_lang(item.path) or self.filter.detect_lang(filename)
-            if lang not in ("美剧", "日剧"):
+            lang = self._detect_lang(dir_path, filename)
+            if lang not in _TARGET_LANGS:
                 continue
-            resolved_show_path = show_path or os.path.dirname(item.path) or "/"
+            resolved_show_path = show_path or dir_path or "/"
             episodes.append(
                 Episode(
                     path=item.path,
@@ -1,55 +1,41 @@
-"""状态存储模块。"""
+"""状态存储模块。
+
+已见剧集现由 :class:`~alist_scaner.storage.SQLiteStore` 的 ``seen_episodes`` 表记录，
+本模块仅用于读取旧版 state.json 以便首次运行时导入。
+"""
 
 from __future__ import annotations
 
 import json
 import os
-import time
 from dataclasses import dataclass, field
 from typing import Dict
 
-from .models import Episode
+try:  # orjson 为可选依赖，缺失时回退到标准库 json
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
 
 
 @dataclass
 class StateStore:
-    """管理 state.json 的读写。"""
+    """读取旧版 state.json。"""
 
     path: str
     _cache: Dict[str, Dict] = field(default_factory=dict, init=False)
+    # 以标志位而非 _cache 是否为空判断是否已加载，空状态文件也只读取一次
+    _loaded: bool = field(default=False, init=False)
 
     def load(self) -> Dict[str, Dict]:
-        if self._cache:
+        if self._loaded:
             return self._cache
+        self._loaded = True
         if not os.path.exists(self.path):
-            self._cache = {}
             return self._cache
-        with open(self.path, "r", encoding="utf-8") as fp:
-            try:
-                self._cache = json.load(fp)
-            except Exception:
-                self._cache = {}
+        with open(self.path, "rb") as fp:
+            data = fp.read()
+        try:
+            self._cache = orjson.loads(data) if orjson is not None else json.loads(data)
+        except Exception:
+            self._cache = {}
         return self._cache
-
-    def save(self) -> None:
-        # 写入时采用临时文件 + 原子替换，避免扫描过程中意外中断导致文件损坏
-        tmp = f"{self.path}.tmp"
-        with open(tmp, "w", encoding="utf-8") as fp:
-            json.dump(self._cache, fp, ensure_ascii=False, indent=2)
-        os.replace(tmp, self.path)
-
-    def mark_seen(self, episode: Episode) -> None:
-        state = self.load()
-        state[episode.path] = {
-            "size": episode.size,
-            "etag": episode.etag,
-            "lastmod": episode.lastmod,
-            "lang": episode.lang,
-            "filename": episode.filename,
-            "show_path": episode.show_path,
-            "ts_seen": int(time.time()),
-        }
-
-    def detect_new(self, episode: Episode) -> bool:
-        state = self.load()
-        return episode.path not in state
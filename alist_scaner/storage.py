@@ -3,39 +3,154 @@
 from __future__ import annotations
 
 import json
+import re
 import sqlite3
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
+from itertools import chain
 from pathlib import Path
-from typing import Iterable, Iterator, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:  # orjson 为可选依赖，缺失时回退到标准库 json
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
 
 from .models import Episode, ShowMetadata
 
+# 数据库结构版本，记录在 PRAGMA user_version 中
+_SCHEMA_VERSION = 1
+# 全部按 TEXT 主键访问的热表，使用 WITHOUT ROWID 省去隐藏 rowid 和额外的主键索引
+_WITHOUT_ROWID_TABLES = ("shows", "episodes", "seen_episodes")
+# 持久性档位 -> (synchronous, wal_autocheckpoint)。数据库可随时从 WebDAV 重新扫描重建，
+# fast 档放弃 fsync 并关闭自动检查点，由 close() 统一回写；进程或系统崩溃时可能丢失最近写入
+_DURABILITY_PRAGMAS = {
+    "full": ("FULL", 1000),
+    "normal": ("NORMAL", 1000),
+    "fast": ("OFF", 0),
+}
+# IN (...) 查询每批的参数个数，低于旧版 SQLite 默认的 999 个绑定变量上限
+_IN_QUERY_CHUNK = 500
+# 多行 VALUES 每条语句写入的行数；固定行数使整块语句每次都能命中语句缓存
+_MULTI_ROW_CHUNK = 100
+
+# 热路径写入语句集中定义为常量：每次调用传入同一字符串，稳定命中连接的预编译语句缓存
+_SQL_UPSERT_SHOW = """
+INSERT INTO shows(path, last_scan_ts, last_remote_lastmod)
+VALUES(?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    last_scan_ts = excluded.last_scan_ts,
+    last_remote_lastmod = excluded.last_remote_lastmod
+"""
+_SQL_UPSERT_EPISODE = """
+INSERT INTO episodes(path, show_path, lang, filename, size, lastmod, etag, updated_at)
+VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    show_path = excluded.show_path,
+    lang = excluded.lang,
+    filename = excluded.filename,
+    size = excluded.size,
+    lastmod = excluded.lastmod,
+    etag = excluded.etag,
+    updated_at = excluded.updated_at
+"""
+_SQL_UPSERT_EPISODE_CHUNK = _SQL_UPSERT_EPISODE.replace(
+    "VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+    "VALUES" + ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?)"] * _MULTI_ROW_CHUNK),
+)
+_SQL_MARK_SEEN = """
+INSERT INTO seen_episodes(path, etag, lastmod, size, ts_seen)
+VALUES(?, ?, ?, ?, ?)
+ON CONFLICT(path) DO UPDATE SET
+    etag = excluded.etag,
+    lastmod = excluded.lastmod,
+    size = excluded.size,
+    ts_seen = excluded.ts_seen
+"""
+_SQL_UPSERT_METADATA = """
+INSERT INTO show_metadata(
+    show_path, title, lang, rating, overview, genres, source, updated_at, in_production
+)
+VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(show_path) DO UPDATE SET
+    title = excluded.title,
+    lang = excluded.lang,
+    rating = excluded.rating,
+    overview = excluded.overview,
+    genres = excluded.genres,
+    source = excluded.source,
+    updated_at = excluded.updated_at,
+    in_production = excluded.in_production
+"""
+
+
+def _decode_genres(raw: object) -> List[str]:
+    """解析 genres 列：新数据为以 NUL 分隔的 UTF-8 BLOB，旧数据为 JSON 文本。"""
+
+    if not raw:
+        return []
+    if isinstance(raw, bytes):
+        return raw.decode("utf-8").split("\x00")
+    try:
+        genres = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except json.JSONDecodeError:
+        return []
+    return genres if isinstance(genres, list) else []
+
+
+def is_scan_cache_fresh(
+    last_scan_ts: int,
+    last_remote_lastmod: str,
+    remote_lastmod: Optional[str],
+    cache_ttl_seconds: int,
+) -> bool:
+    """根据上次扫描记录判断目录缓存是否仍然有效。"""
+
+    if remote_lastmod and last_remote_lastmod and remote_lastmod != last_remote_lastmod:
+        # 远端目录有更新，必须重新扫描
+        return False
+    return cache_ttl_seconds > 0 and int(time.time()) - last_scan_ts < cache_ttl_seconds
+
 
 @dataclass
 class SQLiteStore:
     """负责管理剧集与目录的持久化信息。"""
 
     db_path: str
+    durability: str = "normal"
 
     def __post_init__(self) -> None:
+        if self.durability not in _DURABILITY_PRAGMAS:
+            raise ValueError(f"未知的 durability 档位：{self.durability}")
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
-        self._conn = sqlite3.connect(self.db_path)
+        # isolation_level=None：关闭 sqlite3 模块的隐式 BEGIN，事务边界完全由 transaction() 控制
+        self._conn = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
         self._conn.row_factory = sqlite3.Row
+        self._batch_depth = 0
         self._bootstrap()
 
     def _bootstrap(self) -> None:
         cursor = self._conn.cursor()
         cursor.executescript(
             """
+            PRAGMA page_size = 8192;
             PRAGMA journal_mode = WAL;
-            PRAGMA synchronous = NORMAL;
+            PRAGMA temp_store = MEMORY;
+            PRAGMA cache_size = -65536;
+            PRAGMA mmap_size = 268435456;
+            PRAGMA busy_timeout = 5000;
 
             CREATE TABLE IF NOT EXISTS shows (
                 path TEXT PRIMARY KEY,
                 last_scan_ts INTEGER NOT NULL,
                 last_remote_lastmod TEXT
-            );
+            ) WITHOUT ROWID;
 
             CREATE TABLE IF NOT EXISTS episodes (
                 path TEXT PRIMARY KEY,
@@ -46,7 +161,7 @@ class SQLiteStore:
                 lastmod TEXT,
                 etag TEXT,
                 updated_at INTEGER NOT NULL
-            );
+            ) WITHOUT ROWID;
 
             CREATE TABLE IF NOT EXISTS show_metadata (
                 show_path TEXT PRIMARY KEY,
@@ -56,87 +171,112 @@ class SQLiteStore:
                 overview TEXT,
                 genres TEXT,
                 source TEXT,
-                updated_at INTEGER NOT NULL
+                updated_at INTEGER NOT NULL,
+                in_production INTEGER
             );
+
+            CREATE TABLE IF NOT EXISTS seen_episodes (
+                path TEXT PRIMARY KEY,
+                etag TEXT,
+                lastmod TEXT,
+                size INTEGER,
+                ts_seen INTEGER NOT NULL
+            ) WITHOUT ROWID;
             """
         )
-        self._conn.commit()
+        synchronous, autocheckpoint = _DURABILITY_PRAGMAS[self.durability]
+        cursor.execute(f"PRAGMA synchronous = {synchronous}")
+        cursor.execute(f"PRAGMA wal_autocheckpoint = {autocheckpoint}")
+        # 旧版本数据库缺少 in_production 列时补齐
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(show_metadata)")}
+        if "in_production" not in columns:
+            self._conn.execute("ALTER TABLE show_metadata ADD COLUMN in_production INTEGER")
+        self._migrate_schema()
+        # 覆盖 iter_show_entries 的查询，按剧集取最新一条时无需回表
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_episodes_show_updated"
+            " ON episodes(show_path, updated_at DESC, lang)"
+        )
+
+    def _migrate_schema(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= _SCHEMA_VERSION:
+            return
+        with self.transaction():
+            for table in _WITHOUT_ROWID_TABLES:
+                self._rebuild_without_rowid(table)
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def _rebuild_without_rowid(self, table: str) -> None:
+        # WITHOUT ROWID 无法原地修改，旧库需按原表结构新建表、拷贝数据后替换
+        row = self._conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (table,),
+        ).fetchone()
+        if row is None or "WITHOUT ROWID" in row["sql"].upper():
+            return
+        rebuilt = f"{table}__rebuild"
+        ddl = re.sub(rf'^CREATE TABLE\s+"?{table}"?', f"CREATE TABLE {rebuilt}", row["sql"], count=1)
+        self._conn.execute(f"{ddl} WITHOUT ROWID")
+        self._conn.execute(f"INSERT INTO {rebuilt} SELECT * FROM {table}")
+        self._conn.execute(f"DROP TABLE {table}")
+        self._conn.execute(f"ALTER TABLE {rebuilt} RENAME TO {table}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """将块内的全部写入合并为一个事务，退出时统一提交，异常时回滚。"""
+
+        if self._batch_depth:
+            # 嵌套调用直接并入外层事务
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+            return
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._batch_depth = 1
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        else:
+            self._conn.execute("COMMIT")
+        finally:
+            self._batch_depth = 0
 
     def get_show_metadata(self, show_path: str) -> Optional[ShowMetadata]:
         cursor = self._conn.execute(
-            "SELECT show_path, title, lang, rating, overview, genres, source, updated_at"
+            "SELECT show_path, title, lang, rating, overview, genres, source, updated_at, in_production"
             " FROM show_metadata WHERE show_path = ?",
             (show_path,),
         )
         row = cursor.fetchone()
         if row is None:
             return None
-        genres: list[str] = []
-        if row["genres"]:
-            try:
-                genres = json.loads(row["genres"])
-                if not isinstance(genres, list):
-                    genres = []
-            except json.JSONDecodeError:
-                genres = []
         return ShowMetadata(
             show_path=row["show_path"],
             title=row["title"] or "",
             lang=row["lang"] or "",
             rating=row["rating"],
             overview=row["overview"],
-            genres=genres,
+            genres=_decode_genres(row["genres"]),
             source=row["source"] or "",
             updated_at=row["updated_at"],
+            in_production=None if row["in_production"] is None else bool(row["in_production"]),
         )
 
-    def should_skip_scan(
-        self,
-        path: str,
-        remote_lastmod: Optional[str],
-        cache_ttl_seconds: int,
-    ) -> bool:
-        """判断目录是否可跳过扫描。"""
-
-        cursor = self._conn.execute(
-            "SELECT last_scan_ts, last_remote_lastmod FROM shows WHERE path = ?",
-            (path,),
-        )
-        row = cursor.fetchone()
-        if row is None:
-            return False
-
-        last_scan_ts = row["last_scan_ts"]
-        last_remote_lastmod = row["last_remote_lastmod"] or ""
-        now_ts = int(time.time())
-
-        if remote_lastmod and last_remote_lastmod and remote_lastmod != last_remote_lastmod:
-            # 远端目录有更新，必须重新扫描
-            return False
-
-        if remote_lastmod and last_remote_lastmod and remote_lastmod == last_remote_lastmod:
-            if cache_ttl_seconds > 0 and now_ts - last_scan_ts < cache_ttl_seconds:
-                return True
-            return False
+    def load_shows_state(self) -> Dict[str, Tuple[int, str]]:
+        """一次性读取全部目录的扫描记录，返回 path -> (last_scan_ts, last_remote_lastmod)。"""
 
-        if cache_ttl_seconds > 0 and now_ts - last_scan_ts < cache_ttl_seconds:
-            return True
-
-        return False
+        cursor = self._conn.execute("SELECT path, last_scan_ts, last_remote_lastmod FROM shows")
+        return {row[0]: (row[1], row[2] or "") for row in cursor}
 
     def mark_directory_scanned(self, path: str, remote_lastmod: Optional[str]) -> None:
         now_ts = int(time.time())
-        self._conn.execute(
-            """
-            INSERT INTO shows(path, last_scan_ts, last_remote_lastmod)
-            VALUES(?, ?, ?)
-            ON CONFLICT(path) DO UPDATE SET
-                last_scan_ts = excluded.last_scan_ts,
-                last_remote_lastmod = excluded.last_remote_lastmod
-            """,
-            (path, now_ts, remote_lastmod or ""),
-        )
-        self._conn.commit()
+        self._conn.execute(_SQL_UPSERT_SHOW, (path, now_ts, remote_lastmod or ""))
 
     def upsert_episodes(self, episodes: Iterable[Episode]) -> None:
         now_ts = int(time.time())
@@ -155,39 +295,78 @@ class SQLiteStore:
         ]
         if not rows:
             return
-        self._conn.executemany(
-            """
-            INSERT INTO episodes(path, show_path, lang, filename, size, lastmod, etag, updated_at)
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(path) DO UPDATE SET
-                show_path = excluded.show_path,
-                lang = excluded.lang,
-                filename = excluded.filename,
-                size = excluded.size,
-                lastmod = excluded.lastmod,
-                etag = excluded.etag,
-                updated_at = excluded.updated_at
-            """,
-            rows,
-        )
-        self._conn.commit()
+        # executemany 在自动提交模式下会逐行提交，这里显式包进同一个事务
+        with self.transaction():
+            # 整块行用一条多行 INSERT 写入，省去逐行往返；不足一块的余数交给 executemany
+            full = len(rows) - len(rows) % _MULTI_ROW_CHUNK
+            for start in range(0, full, _MULTI_ROW_CHUNK):
+                params = list(chain.from_iterable(rows[start:start + _MULTI_ROW_CHUNK]))
+                self._conn.execute(_SQL_UPSERT_EPISODE_CHUNK, params)
+            if full < len(rows):
+                self._conn.executemany(_SQL_UPSERT_EPISODE, rows[full:])
+
+    def has_seen_episodes(self) -> bool:
+        """是否已记录过任何剧集，用于判断是否为首次运行。"""
+
+        cursor = self._conn.execute("SELECT 1 FROM seen_episodes LIMIT 1")
+        return cursor.fetchone() is not None
+
+    def seen_episode_paths(self, paths: Iterable[str]) -> Set[str]:
+        """批量查询给定路径中已记录为已见的部分。"""
+
+        candidates: List[str] = list(paths)
+        seen: Set[str] = set()
+        for start in range(0, len(candidates), _IN_QUERY_CHUNK):
+            chunk = candidates[start:start + _IN_QUERY_CHUNK]
+            cursor = self._conn.execute(
+                f"SELECT path FROM seen_episodes WHERE path IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            seen.update(row[0] for row in cursor)
+        return seen
+
+    def mark_seen_many(self, episodes: Iterable[Episode]) -> None:
+        now_ts = int(time.time())
+        rows = [
+            (episode.path, episode.etag, episode.lastmod, episode.size, now_ts)
+            for episode in episodes
+        ]
+        if not rows:
+            return
+        with self.transaction():
+            self._conn.executemany(_SQL_MARK_SEEN, rows)
+
+    def import_seen_state(self, state: Dict[str, Dict]) -> int:
+        """导入旧版 state.json 的内容，已存在的路径保持不变，返回导入条数。"""
+
+        now_ts = int(time.time())
+        rows = [
+            (
+                path,
+                record.get("etag", ""),
+                record.get("lastmod", ""),
+                record.get("size", 0),
+                record.get("ts_seen", now_ts),
+            )
+            for path, record in state.items()
+            if isinstance(record, dict)
+        ]
+        if not rows:
+            return 0
+        with self.transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen_episodes(path, etag, lastmod, size, ts_seen)"
+                " VALUES(?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
 
     def upsert_show_metadata(self, metadata: ShowMetadata) -> None:
         now_ts = int(time.time())
-        genres = json.dumps(metadata.genres, ensure_ascii=False) if metadata.genres else "[]"
+        # 类型名称都是短字符串，直接以 NUL 拼接存为 BLOB，读取时 split 即可，无需 JSON 编解码
+        genres = "\x00".join(metadata.genres).encode("utf-8")
         self._conn.execute(
-            """
-            INSERT INTO show_metadata(show_path, title, lang, rating, overview, genres, source, updated_at)
-            VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(show_path) DO UPDATE SET
-                title = excluded.title,
-                lang = excluded.lang,
-                rating = excluded.rating,
-                overview = excluded.overview,
-                genres = excluded.genres,
-                source = excluded.source,
-                updated_at = excluded.updated_at
-            """,
+            _SQL_UPSERT_METADATA,
             (
                 metadata.show_path,
                 metadata.title,
@@ -197,29 +376,34 @@ class SQLiteStore:
                 genres,
                 metadata.source,
                 now_ts,
+                None if metadata.in_production is None else int(metadata.in_production),
             ),
         )
-        self._conn.commit()
 
     def iter_show_entries(self) -> Iterator[Tuple[str, str]]:
         """返回数据库中已记录的剧集路径及其语言。"""
 
         cursor = self._conn.execute(
             """
-            SELECT e.show_path, COALESCE(e.lang, '') AS lang
-            FROM episodes e
-            INNER JOIN (
-                SELECT show_path, MAX(updated_at) AS updated_at
+            SELECT show_path, COALESCE(lang, '') AS lang
+            FROM (
+                SELECT
+                    show_path,
+                    lang,
+                    ROW_NUMBER() OVER (PARTITION BY show_path ORDER BY updated_at DESC) AS rn
                 FROM episodes
-                GROUP BY show_path
-            ) latest
-            ON e.show_path = latest.show_path AND e.updated_at = latest.updated_at
-            GROUP BY e.show_path
-            ORDER BY e.show_path
+            )
+            WHERE rn = 1
+            ORDER BY show_path
             """
         )
         for row in cursor:
             yield (row["show_path"], row["lang"])
 
     def close(self) -> None:
+        if self.durability == "fast":
+            # 自动检查点已关闭，退出前把 WAL 全部回写主库并截断
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        # 长连接关闭前按 SQLite 的建议让查询规划器更新统计信息
+        self._conn.execute("PRAGMA optimize")
         self._conn.close()
@@ -3,14 +3,27 @@
 from __future__ import annotations
 
 import logging
+import threading
 import urllib.parse
-import xml.etree.ElementTree as ET
-from dataclasses import dataclass
-from typing import Iterable, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import IO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from urllib.parse import unquote
 
 import requests
 from requests import HTTPError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # lxml 为可选依赖，基于 libxml2 解析更快；缺失时回退到标准库
+    from lxml import etree as ET
+
+    _HAS_LXML = True
+except ImportError:  # pragma: no cover - 取决于运行环境
+    import xml.etree.ElementTree as ET
+
+    _HAS_LXML = False
 
 from .models import WebDAVResource
 
@@ -18,6 +31,43 @@ NAMESPACES = {
     "d": "DAV:",
 }
 
+# 预先展开为 {DAV:} 限定名，find 时无需再按前缀映射查找命名空间
+_RESPONSE_TAG = "{DAV:}response"
+_HREF_PATH = "{DAV:}href"
+_PROP_PATH = "{DAV:}propstat/{DAV:}prop"
+_RESOURCETYPE_PATH = "{DAV:}resourcetype"
+_COLLECTION_PATH = "{DAV:}collection"
+_CONTENTLENGTH_PATH = "{DAV:}getcontentlength"
+_LASTMODIFIED_PATH = "{DAV:}getlastmodified"
+_ETAG_PATH = "{DAV:}getetag"
+
+# PROPFIND 请求体与各 Depth 的请求头固定不变，模块加载时一次性构造，避免每次请求重新编码
+_PROPFIND_BODY = b"""<?xml version="1.0" encoding="utf-8" ?>
+<d:propfind xmlns:d="DAV:">
+  <d:prop>
+    <d:resourcetype/>
+    <d:getcontentlength/>
+    <d:getlastmodified/>
+    <d:getetag/>
+  </d:prop>
+</d:propfind>"""
+_PROPFIND_HEADERS = {
+    depth: {"Depth": depth, "Content-Type": "text/xml; charset=utf-8"}
+    for depth in ("0", "1", "infinity")
+}
+
+# 服务端以这些状态码拒绝 Depth: infinity 时，本客户端后续不再尝试
+_INFINITY_REFUSED_STATUSES = (400, 403, 501)
+
+# 网关抖动或限流时由 urllib3 退避重试；重试用尽后返回最后一次响应，仍由 raise_for_status 抛出 HTTPError
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset(["PROPFIND"]),
+    raise_on_status=False,
+)
+
 
 @dataclass
 class WebDAVClient:
@@ -27,129 +77,336 @@ class WebDAVClient:
     auth: Optional[Tuple[str, str]]
     verify_ssl: bool
     timeout: int
+    max_concurrency: int = 4
+    depth_infinity: bool = False
+    _inflight: threading.BoundedSemaphore = field(init=False, repr=False)
+    _session: requests.Session = field(init=False, repr=False)
+    _base_path: str = field(init=False, repr=False)
+    _infinity_supported: bool = field(default=True, init=False, repr=False)
+    # walk 共用的线程池，首次并发遍历时创建
+    _executor: Optional[ThreadPoolExecutor] = field(default=None, init=False, repr=False)
+    _executor_lock: threading.Lock = field(init=False, repr=False)
+    # 原样 URL 404 后改用的写法是否带末尾斜杠；同一服务端对目录 URL 的写法要求一致，后续请求优先采用。
+    # 尚无 404 证据时保持 None，URL 按服务端给出的原样发送
+    _prefer_slash: Optional[bool] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        workers = max(self.max_concurrency, 1)
+        # 多个线程共用同一客户端时，限制同时在途的 PROPFIND 数量，避免压垮 Alist
+        self._inflight = threading.BoundedSemaphore(workers)
+        self._executor_lock = threading.Lock()
+        # 复用同一 Session 的连接池，避免每个目录都重新建立 TCP/TLS 连接
+        self._session = requests.Session()
+        self._session.auth = self.auth
+        adapter = HTTPAdapter(pool_maxsize=workers, max_retries=_RETRY)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # base_url 在客户端生命周期内不变，其路径部分只解析一次
+        self._base_path = urllib.parse.urlparse(self.base_url).path
+
+    def close(self) -> None:
+        """关闭共用的线程池与连接池。"""
+
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._session.close()
 
     def join_url(self, path: str) -> str:
         if not path.startswith("/"):
             path = "/" + path
         return self.base_url + urllib.parse.quote(path, safe="/%")
 
-    def propfind_smart(self, url: str, depth: int = 1) -> requests.Response:
-        def _do(url_try: str, d: int) -> requests.Response:
-            headers = {
-                "Depth": str(d),
+    def propfind_smart(self, url: str, depth: Union[int, str] = 1) -> requests.Response:
+        """发起 PROPFIND，返回尚未读取正文的流式响应，调用方负责关闭。"""
+
+        def _do(url_try: str, d: Union[int, str]) -> requests.Response:
+            depth_value = str(d)
+            headers = _PROPFIND_HEADERS.get(depth_value) or {
+                "Depth": depth_value,
                 "Content-Type": "text/xml; charset=utf-8",
             }
-            body = """<?xml version="1.0" encoding="utf-8" ?>
-<d:propfind xmlns:d="DAV:">
-  <d:prop>
-    <d:resourcetype/>
-    <d:getcontentlength/>
-    <d:getlastmodified/>
-    <d:getetag/>
-  </d:prop>
-</d:propfind>"""
-            response = requests.request(
+            response = self._session.request(
                 method="PROPFIND",
                 url=url_try,
-                data=body.encode("utf-8"),
+                data=_PROPFIND_BODY,
                 headers=headers,
-                auth=self.auth,
+                # verify 仍逐次传入：仅设在 Session 上时，会被 REQUESTS_CA_BUNDLE 等环境变量覆盖
                 verify=self.verify_ssl,
                 timeout=self.timeout,
+                stream=True,
             )
-            response.raise_for_status()
+            try:
+                response.raise_for_status()
+            except HTTPError:
+                response.close()
+                raise
             return response
 
+        slashed = url if url.endswith("/") else url + "/"
+        bare = url[:-1] if url.endswith("/") else url
+        if self._prefer_slash is None:
+            primary, alt = (slashed, bare) if url.endswith("/") else (bare, slashed)
+        else:
+            primary, alt = (slashed, bare) if self._prefer_slash else (bare, slashed)
+
+        # 依次尝试：首选写法 -> 切换末尾斜杠 -> 切换后以 Depth 0 兜底；
+        # 只有首选写法返回 404 时才继续后面的尝试
+        attempts = ((primary, depth), (alt, depth), (alt, 0))
+        last_exc: Optional[Exception] = None
+        for index, (url_try, d) in enumerate(attempts):
+            try:
+                response = _do(url_try, d)
+            except HTTPError as exc:
+                if index == 0 and getattr(exc.response, "status_code", None) != 404:
+                    raise
+                last_exc = exc
+                continue
+            except Exception as exc:  # noqa: BLE001
+                if index == 0:
+                    raise
+                last_exc = exc
+                continue
+            if index == 1:
+                # 首选写法 404、切换斜杠后才成功，说明服务端确实区分两种写法，记下供后续目录使用。
+                # 首选写法直接成功时不作推断：requests 会静默跟随 301，成功不代表该写法无需重定向；
+                # Depth 0 只是单个 URL 的兜底，同样不能作为后续目录的首选方式
+                self._prefer_slash = url_try.endswith("/")
+            return response
+        raise HTTPError(
+            f"PROPFIND 404. Tried: {primary} and {alt} (Depth {depth} / then 0)"
+        ) from last_exc
+
+    def list_directory(self, path: str, depth: Union[int, str] = 1) -> List[WebDAVResource]:
+        return list(self.iter_directory(path, depth=depth))
+
+    def iter_directory(self, path: str, depth: Union[int, str] = 1) -> Iterator[WebDAVResource]:
+        """边接收 PROPFIND 响应边解析，逐个产出资源。"""
+
+        url = self.join_url(path)
+        logging.info("PROPFIND %s", urllib.parse.unquote(url))
+        # 流式响应在正文读完前一直占用连接，因此并发名额覆盖到解析结束
+        with self._inflight, self.propfind_smart(url, depth=depth) as response:
+            # 服务端启用 gzip 时由 urllib3 负责解压，解析器直接读取字节流
+            response.raw.decode_content = True
+            yield from self._parse_propfind_xml(response.raw)
+
+    def walk(
+        self,
+        roots: Iterable[str],
+        skip_dir: Optional[Callable[[str], bool]] = None,
+    ) -> Iterator[WebDAVResource]:
+        """广度优先遍历目录树，逐个产出资源，调用方可边遍历边处理。
+
+        ``skip_dir`` 对子目录路径返回 True 时，该目录及其整个子树都不会被请求。
+        启用 ``depth_infinity`` 时每个根目录先尝试一次 Depth: infinity，失败再逐层遍历。
+        """
+
+        pending: Deque[str] = deque()
+        for root in roots:
+            resources = self._list_infinity(root) if self.depth_infinity else None
+            if resources is None:
+                pending.append(root)
+            else:
+                yield from self._iter_subtree(root, resources, skip_dir)
+        seen_dirs: Set[str] = set()
+        workers = max(self.max_concurrency, 1)
+
+        if workers == 1:
+            while pending:
+                current = pending.popleft()
+                # 每一层都以 Depth=1 枚举子节点，配合队列实现广度优先遍历
+                try:
+                    yield from self._iter_children(
+                        current, self.iter_directory(current, depth=1), seen_dirs, pending, skip_dir
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    logging.warning("PROPFIND 失败：%s -> %s", urllib.parse.unquote(current), exc)
+            return
+
+        # 不同目录的 PROPFIND 互不依赖，同时保持至多 workers 个请求在途；
+        # 结果只在当前线程产出，子目录随之入队，无需额外加锁
+        executor = self._get_executor()
+        running: Dict[Future, str] = {}
+        while pending or running:
+            while pending and len(running) < workers:
+                current = pending.popleft()
+                running[executor.submit(self.list_directory, current, 1)] = current
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                current = running.pop(future)
+                try:
+                    resources = future.result()
+                except Exception as exc:  # noqa: BLE001
+                    logging.warning("PROPFIND 失败：%s -> %s", urllib.parse.unquote(current), exc)
+                    continue
+                yield from self._iter_children(current, resources, seen_dirs, pending, skip_dir)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # 扫描器会在自己的线程池里对每个剧集目录调用 walk，各次 walk 共用同一线程池，
+        # 线程总数不超过 max_concurrency，也不必为每个剧集目录反复创建、销毁线程
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(self.max_concurrency, 1),
+                    thread_name_prefix="propfind",
+                )
+            return self._executor
+
+    def _list_infinity(self, root: str) -> Optional[List[WebDAVResource]]:
+        """以 Depth: infinity 一次取回整棵子树；不可用或结果不可信时返回 None。"""
+
+        if not self._infinity_supported:
+            return None
         try:
-            return _do(url, depth)
+            resources = self.list_directory(root, depth="infinity")
         except HTTPError as exc:
             status = getattr(exc.response, "status_code", None)
-            if status == 404:
-                alt = url[:-1] if url.endswith("/") else url + "/"
-                try:
-                    return _do(alt, depth)
-                except HTTPError as exc2:
-                    try:
-                        return _do(alt, 0)
-                    except Exception as exc3:  # noqa: BLE001
-                        raise HTTPError(
-                            f"PROPFIND 404. Tried: {url} and {alt} (Depth {depth} / then 0)"
-                        ) from exc3
-            raise
-
-    def list_directory(self, path: str, depth: int = 1) -> List[WebDAVResource]:
-        url = self.join_url(path)
-        logging.info("PROPFIND %s", urllib.parse.unquote(url))
-        response = self.propfind_smart(url, depth=depth)
-        return self._parse_propfind_xml(response.text)
+            if status in _INFINITY_REFUSED_STATUSES:
+                self._infinity_supported = False
+                logging.info("服务端拒绝 Depth: infinity（HTTP %s），改为逐层遍历。", status)
+            else:
+                logging.warning("Depth: infinity 请求失败：%s -> %s", urllib.parse.unquote(root), exc)
+            return None
+        except Exception as exc:  # noqa: BLE001
+            logging.warning("Depth: infinity 请求失败：%s -> %s", urllib.parse.unquote(root), exc)
+            return None
 
-    def walk(self, roots: Iterable[str]) -> List[WebDAVResource]:
-        results: List[WebDAVResource] = []
-        queue = list(roots)
-        seen_dirs = set()
+        # 结果无法区分“服务端照办了”与“服务端悄悄降级了”，这里按层级做保守判断：
+        # - 没有任何子项：多半是 404 回退退化成了 Depth 0，交回逐层遍历；
+        # - 有子目录却没有更深一层的条目：服务端把 infinity 当作 1 处理，同样交回逐层遍历；
+        #   子目录恰好全为空时也会落入这一支，只是多花几次请求，结果依旧正确；
+        # - 只有文件没有子目录：Depth 1 与 infinity 的结果本就相同，直接采用
+        root_key = root.rstrip("/")
+        child_depth = root_key.count("/") + 1
+        depths = [resource.path.rstrip("/").count("/") for resource in resources]
+        if not any(depth >= child_depth for depth in depths):
+            return None
+        has_subdirs = any(
+            resource.is_dir and depth == child_depth for resource, depth in zip(resources, depths)
+        )
+        if has_subdirs and not any(depth > child_depth for depth in depths):
+            return None
+        return resources
 
-        while queue:
-            current = queue.pop(0)
-            # 每一层都以 Depth=1 枚举子节点，配合队列实现广度优先遍历
-            try:
-                entries = self.list_directory(current, depth=1)
-                # print(entries)
-                # for entry in entries:
-                #     logging.debug("walk -> list_directory -> Found: %s (is_dir=%s)", entry.path, entry.is_dir)
-            except Exception as exc:  # noqa: BLE001
-                logging.warning("PROPFIND 失败：%s -> %s", urllib.parse.unquote(current), exc)
+    def _iter_subtree(
+        self,
+        root: str,
+        resources: Iterable[WebDAVResource],
+        skip_dir: Optional[Callable[[str], bool]],
+    ) -> Iterator[WebDAVResource]:
+        # 整棵子树已一次取回，剪枝改为判断条目所在的各级目录是否被剪除；
+        # 每个目录只判断一次并缓存结果，祖先被剪除的目录直接沿用，不在根目录之下的条目一律丢弃
+        root_key = root.rstrip("/")
+        prefix = root_key + "/"
+        pruned: Dict[str, bool] = {root_key: False}
+
+        def is_pruned(dir_path: str) -> bool:
+            if dir_path not in pruned:
+                parent = dir_path.rpartition("/")[0]
+                pruned[dir_path] = (
+                    not dir_path.startswith(prefix)
+                    or is_pruned(parent)
+                    or (skip_dir is not None and skip_dir(dir_path))
+                )
+            return pruned[dir_path]
+
+        for resource in resources:
+            path = resource.path.rstrip("/")
+            if path == root_key:
                 continue
+            if is_pruned(path if resource.is_dir else path.rpartition("/")[0]):
+                continue
+            yield resource
 
-            for resource in entries:
-                if resource.path.rstrip("/") == current.rstrip("/"):
-                    continue
-                results.append(resource)
-                if resource.is_dir and resource.path not in seen_dirs:
-                    seen_dirs.add(resource.path)
-                    queue.append(resource.path)
-        return results
-
-    def _parse_propfind_xml(self, xml_text: str) -> List[WebDAVResource]:
-        resources: List[WebDAVResource] = []
-        root = ET.fromstring(xml_text)
-        for resp in root.findall("d:response", NAMESPACES):
-            href_el = resp.find("d:href", NAMESPACES)
-            if href_el is None:
+    def _iter_children(
+        self,
+        current: str,
+        resources: Iterable[WebDAVResource],
+        seen_dirs: Set[str],
+        pending: Deque[str],
+        skip_dir: Optional[Callable[[str], bool]],
+    ) -> Iterator[WebDAVResource]:
+        # PROPFIND 结果首项通常是目录自身，这里按去掉末尾斜杠后的路径排除；当前目录只需处理一次
+        current_key = current.rstrip("/")
+        for resource in resources:
+            if resource.path.rstrip("/") == current_key:
                 continue
-            href = href_el.text or ""
-            propstat = resp.find("d:propstat/d:prop", NAMESPACES)
-            if propstat is None:
+            if resource.is_dir and skip_dir is not None and skip_dir(resource.path):
+                logging.debug("剪除目录：%s", resource.path)
                 continue
-            rtype = propstat.find("d:resourcetype", NAMESPACES)
-            is_dir = rtype is not None and rtype.find("d:collection", NAMESPACES) is not None
-            size_el = propstat.find("d:getcontentlength", NAMESPACES)
-            if size_el is not None and size_el.text and size_el.text.isdigit():
-                size = int(size_el.text)
-            else:
-                size = 0
-            lastmod_el = propstat.find("d:getlastmodified", NAMESPACES)
-            lastmod = (lastmod_el.text or "") if lastmod_el is not None else ""
-            etag_el = propstat.find("d:getetag", NAMESPACES)
-            etag = (etag_el.text or "") if etag_el is not None else ""
-            # PROPFIND 中给出的 href 可能包含完整 URL，这里统一为解码后的 WebDAV 路径
-            resources.append(
-                WebDAVResource(
-                    path=self._href_to_path(href),
-                    is_dir=is_dir,
-                    size=size,
-                    lastmod=lastmod,
-                    etag=etag,
-                )
-            )
-        return resources
+            yield resource
+            if resource.is_dir and resource.path not in seen_dirs:
+                seen_dirs.add(resource.path)
+                pending.append(resource.path)
+
+    def _parse_propfind_xml(self, source: IO[bytes]) -> Iterator[WebDAVResource]:
+        # 增量解析：每读完一个 d:response 即产出资源并释放已处理的节点，内存占用与目录大小无关
+        if _HAS_LXML:
+            yield from self._iterparse_lxml(source)
+            return
+        root = None
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != _RESPONSE_TAG:
+                continue
+            resource = self._parse_response(elem)
+            root.clear()
+            if resource is not None:
+                yield resource
+
+    def _iterparse_lxml(self, source: IO[bytes]) -> Iterator[WebDAVResource]:
+        # 由 libxml2 按标签过滤，只回调 d:response 的结束事件；不展开实体，防范实体膨胀
+        for _, elem in ET.iterparse(
+            source, events=("end",), tag=_RESPONSE_TAG, resolve_entities=False
+        ):
+            resource = self._parse_response(elem)
+            # lxml 的 clear 不会把节点从父节点摘除，需一并删掉已处理的前序兄弟节点
+            elem.clear(keep_tail=True)
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+            if resource is not None:
+                yield resource
+
+    def _parse_response(self, resp: ET.Element) -> Optional[WebDAVResource]:
+        # findtext 在节点缺失时返回 None，节点存在但无文本时返回空字符串
+        href = resp.findtext(_HREF_PATH)
+        if href is None:
+            return None
+        propstat = resp.find(_PROP_PATH)
+        if propstat is None:
+            return None
+        rtype = propstat.find(_RESOURCETYPE_PATH)
+        is_dir = rtype is not None and rtype.find(_COLLECTION_PATH) is not None
+        size_text = propstat.findtext(_CONTENTLENGTH_PATH, "")
+        size = int(size_text) if size_text.isdigit() else 0
+        lastmod = propstat.findtext(_LASTMODIFIED_PATH, "")
+        etag = propstat.findtext(_ETAG_PATH, "")
+        # PROPFIND 中给出的 href 可能包含完整 URL，这里统一为解码后的 WebDAV 路径
+        return WebDAVResource(
+            path=self._href_to_path(href),
+            is_dir=is_dir,
+            size=size,
+            lastmod=lastmod,
+            etag=etag,
+        )
 
     def _href_to_path(self, href: str) -> str:
-        parsed = urllib.parse.urlparse(href)
-        path = parsed.path or href
-        base_path = urllib.parse.urlparse(self.base_url).path
-        if base_path and path.startswith(base_path):
-            path = path[len(base_path):]
-            if not path.startswith("/"):
-                path = "/" + path
-        # 解码百分号编码，便于后续中文路径匹配
-        return unquote(path)
+        if href.startswith("/") and not href.startswith("//") and "?" not in href and "#" not in href:
+            # 常见情形：href 本身就是以 / 开头的纯路径，无需再经过 urlsplit
+            path = href
+        else:
+            # urlsplit 不会像 urlparse 那样把最后一段中的 ";xxx" 当作参数截掉
+            path = urllib.parse.urlsplit(href).path or href
+        if self._base_path:
+            relative = path.removeprefix(self._base_path)
+            if len(relative) != len(path) and not relative.startswith("/"):
+                relative = "/" + relative
+            path = relative
+        # 解码百分号编码，便于后续中文路径匹配；纯 ASCII 路径无需解码
+        return unquote(path) if "%" in path else path